@@ -3,34 +3,127 @@ FastAPI service for Breast Cancer classification prediction.
 Loads the trained model and exposes a /predict endpoint.
 """
 
+import asyncio
+import inspect
+import operator
+import os
+import tempfile
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+# keep OpenMP/BLAS single-threaded per worker (must be set before numpy/sklearn
+# load); concurrency comes from uvicorn workers and the batcher instead
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+# -----------------------------------------------------------------------------
+# Optional: Intel oneDAL kernels. Must be patched in before sklearn is imported
+# (joblib.load imports it while unpickling the model).
+# -----------------------------------------------------------------------------
+if os.getenv("USE_SKLEARNEX") == "1":
+    try:
+        from sklearnex import patch_sklearn
+
+        patch_sklearn()
+        print("✅ sklearnex patch applied")
+    except ImportError as e:
+        print("⚠️ USE_SKLEARNEX=1 but scikit-learn-intelex is not installed:", repr(e))
+
+import anyio.to_thread
 import joblib
+import msgpack
+import numpy as np
+import orjson
 import pandas as pd
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from sklearn.decomposition import PCA
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from starlette._utils import get_route_path
+from typing_extensions import TypedDict
 
 # -----------------------------------------------------------------------------
 # Paths
 # -----------------------------------------------------------------------------
 REPO_DIR = Path(__file__).resolve().parents[1]  # api/ -> repo root
-MODEL_PATH = REPO_DIR / "models" / "final_model.joblib"
+# The model is memory-mapped (see startup_event), so pointing MODEL_PATH at a
+# copy on /dev/shm or another tmpfs keeps its pages hot in the page cache.
+MODEL_PATH = Path(os.getenv("MODEL_PATH", REPO_DIR / "models" / "final_model.joblib"))
+
+
+class _GZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware that leaves /predict_stream alone: gzip would buffer every
+    NDJSON line until the end. Matches the route path, i.e. without any
+    --root-path prefix a proxy mounts the app under.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and get_route_path(scope) == "/predict_stream":
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
 
 app = FastAPI(
     title="Breast Cancer Prediction API",
     description="FastAPI service for predicting malignancy using a trained ML pipeline",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
+# only /docs, /openapi.json and large batches are worth compressing;
+# small /predict payloads pass straight through
+app.add_middleware(_GZipMiddleware, minimum_size=1024)
 
 model = None  # will be loaded on startup
 REQUIRED_COLUMNS: List[str] = []  # will be set after model loads
+FEATURE_COLUMNS: Tuple[str, ...] = ()  # REQUIRED_COLUMNS as a tuple for the hot path
+REQUIRED_SET: frozenset = frozenset()  # for the per-request missing-column check
+N_FEATURES = 0
+GET_FEATURES: Optional[Callable] = None  # itemgetter(*FEATURE_COLUMNS): one C call per row
+NUMERIC_ONLY = False  # True if every feature is numeric: enables the float32 fast path
+ACCEPTS_NDARRAY = False  # True if model.predict works on a plain float array
+PREDICT_FN: Optional[Callable] = None  # sklearn or ONNX Runtime, chosen at startup
+CHECK_FINITE = False  # True when PREDICT_FN is the fused predictor, which skips sklearn's input checks
+
+# USE_ONNX=1: convert the pipeline to ONNX once at startup and serve it with
+# ONNX Runtime; falls back to sklearn if conversion fails. The converter and
+# runtime are optional: pip install -r api/requirements-onnx.txt
+USE_ONNX = os.getenv("USE_ONNX") == "1"
+# USE_ONNX_INT8=1: additionally apply dynamic INT8 weight quantization
+USE_ONNX_INT8 = os.getenv("USE_ONNX_INT8") == "1"
+
+# -----------------------------------------------------------------------------
+# Micro-batching: concurrent /predict calls arriving within MAX_WAIT_MS are
+# coalesced into a single model.predict call (up to MAX_BATCH requests).
+# -----------------------------------------------------------------------------
+MAX_BATCH = 64
+MAX_WAIT_MS = 5
+
+# predict is CPU-bound: one thread per core instead of the 40-thread default
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", os.cpu_count() or 1))
+
+# /predict_stream predicts and flushes this many rows at a time
+STREAM_CHUNK = 1024
+
+_batch_queue: Optional[asyncio.Queue] = None
+_batch_task: Optional[asyncio.Task] = None
 
 
 # -----------------------------------------------------------------------------
 # Schemas
 # -----------------------------------------------------------------------------
 class PredictRequest(BaseModel):
+    """
+    All instances must share the same keys: required columns are checked on
+    the first instance, later instances fail only if a column is missing.
+    """
+
     instances: List[Dict[str, Any]]
 
 
@@ -39,49 +132,434 @@ class PredictResponse(BaseModel):
     count: int
 
 
+def _make_request_adapter(columns) -> TypeAdapter:
+    """
+    Validator for the /predict body. For a numeric-only model, each instance
+    is a TypedDict of float fields so pydantic-core checks the types while
+    parsing the JSON. total=False leaves missing-column errors to the 400
+    check in predict().
+    """
+    instance = TypedDict("Instance", {c: float for c in columns}, total=False) if columns else Dict[str, Any]
+    return TypeAdapter(TypedDict("PredictRequestBody", {"instances": List[instance]}))
+
+
+def _request_body_schema(adapter: TypeAdapter) -> Dict[str, Any]:
+    """JSON schema of the body with $defs inlined (OpenAPI resolves $ref from the document root)."""
+    schema = adapter.json_schema()
+    defs = schema.pop("$defs", {})
+
+    def inline(node):
+        if isinstance(node, dict):
+            ref = node.get("$ref", "")
+            if ref.startswith("#/$defs/"):
+                return inline(defs[ref.rsplit("/", 1)[-1]])
+            return {k: inline(v) for k, v in node.items()}
+        if isinstance(node, list):
+            return [inline(v) for v in node]
+        return node
+
+    schema = inline(schema)
+    schema["description"] = inspect.cleandoc(PredictRequest.__doc__)
+    return schema
+
+
+PREDICT_ADAPTER = _make_request_adapter(())  # rebuilt with typed fields for numeric-only models
+
+# predict() reads the raw body, so document the request schema explicitly
+# (the schema is replaced with the typed one once the model is loaded)
+_PREDICT_OPENAPI = {
+    "requestBody": {
+        "content": {"application/json": {"schema": PredictRequest.model_json_schema()}},
+        "required": True,
+    }
+}
+_PREDICT_MSGPACK_OPENAPI = {
+    "requestBody": {
+        "content": {"application/msgpack": {"schema": PredictRequest.model_json_schema()}},
+        "required": True,
+    }
+}
+
+
 # -----------------------------------------------------------------------------
 # Startup: load model with loud debugging
 # -----------------------------------------------------------------------------
 @app.on_event("startup")
-def startup_event():
-    global model, REQUIRED_COLUMNS
+async def startup_event():
+    global model, REQUIRED_COLUMNS, FEATURE_COLUMNS, REQUIRED_SET, N_FEATURES, NUMERIC_ONLY, ACCEPTS_NDARRAY
+    global GET_FEATURES, PREDICT_FN, CHECK_FINITE, PREDICT_ADAPTER
+    global _batch_queue, _batch_task
     print("=" * 80)
     print("🚀 Starting API")
     print(f"REPO_DIR   = {REPO_DIR}")
     print(f"MODEL_PATH = {MODEL_PATH}")
     print(f"MODEL_EXISTS? {MODEL_PATH.exists()}")
+    print(f"THREADPOOL_SIZE = {THREADPOOL_SIZE}")
     print("=" * 80)
 
+    # cap both the sync-route threadpool and the executor used by the batcher
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=THREADPOOL_SIZE))
+
     if not MODEL_PATH.exists():
         model = None
         return
 
     try:
-        model = joblib.load(MODEL_PATH)
+        # mmap_mode="r": numpy arrays in the pickle are mapped read-only instead of
+        # copied onto the heap, so uvicorn workers share the same physical pages.
+        # Requires an uncompressed dump (joblib.dump(..., compress=0)).
+        model = joblib.load(MODEL_PATH, mmap_mode="r")
         print("✅ Model loaded OK:", type(model))
         REQUIRED_COLUMNS = list(getattr(model, "feature_names_in_", []))
         print("REQUIRED_COLUMNS:", REQUIRED_COLUMNS)
+        FEATURE_COLUMNS = tuple(REQUIRED_COLUMNS)
+        REQUIRED_SET = frozenset(REQUIRED_COLUMNS)
+        N_FEATURES = len(FEATURE_COLUMNS)
+        GET_FEATURES = operator.itemgetter(*FEATURE_COLUMNS) if FEATURE_COLUMNS else None
+        NUMERIC_ONLY = _is_numeric_only(model, REQUIRED_COLUMNS)
+        print("NUMERIC_ONLY:", NUMERIC_ONLY)
+        if NUMERIC_ONLY:
+            # string/categorical columns keep the untyped Dict[str, Any] schema
+            PREDICT_ADAPTER = _make_request_adapter(FEATURE_COLUMNS)
+            body_schema = _request_body_schema(PREDICT_ADAPTER)
+            _PREDICT_OPENAPI["requestBody"]["content"]["application/json"]["schema"] = body_schema
+            _PREDICT_MSGPACK_OPENAPI["requestBody"]["content"]["application/msgpack"]["schema"] = body_schema
+            app.openapi_schema = None  # regenerate /openapi.json with the typed body
+        ACCEPTS_NDARRAY = NUMERIC_ONLY and _accepts_ndarray(model, N_FEATURES)
+        print("ACCEPTS_NDARRAY:", ACCEPTS_NDARRAY)
     except Exception as e:
         model = None
         print("❌ Failed to load model:", repr(e))
+        return
+
+    PREDICT_FN = _sklearn_predict
+    if USE_ONNX and NUMERIC_ONLY:
+        try:
+            PREDICT_FN = _build_onnx_predict(model, N_FEATURES)
+            print("✅ Serving ONNX Runtime session")
+        except ImportError as e:
+            print("⚠️ USE_ONNX=1 but ONNX packages are missing (api/requirements-onnx.txt), using sklearn:", repr(e))
+        except Exception as e:
+            print("⚠️ ONNX conversion failed, using sklearn:", _short_error(e))
+    elif NUMERIC_ONLY:
+        fused = _build_fused_predict(model)
+        if fused is not None:
+            PREDICT_FN = fused
+            CHECK_FINITE = True
+            print("✅ Serving fused NumPy preprocessing + final estimator")
+
+    # warm-up: the first predict allocates scratch buffers / spins up threadpools
+    if NUMERIC_ONLY:
+        try:
+            PREDICT_FN(np.zeros((1, N_FEATURES), dtype=np.float32))
+            print("✅ Model warmed up")
+        except Exception as e:
+            print("⚠️ Warm-up predict failed:", repr(e))
+
+    _batch_queue = asyncio.Queue()
+    _batch_task = asyncio.create_task(_batch_worker())
+    print(f"✅ Micro-batcher started (MAX_BATCH={MAX_BATCH}, MAX_WAIT_MS={MAX_WAIT_MS})")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if _batch_task is not None:
+        _batch_task.cancel()
+
+
+# -----------------------------------------------------------------------------
+# Input helpers
+# -----------------------------------------------------------------------------
+def _learned_strings(est) -> bool:
+    """
+    True if a fitted step learned string values, e.g. OneHotEncoder categories
+    or a most_frequent SimpleImputer fill. Walks Pipeline, ColumnTransformer
+    and FeatureUnion children.
+    """
+    if isinstance(est, Pipeline):
+        return any(_learned_strings(step) for _, step in est.steps)
+    children = getattr(est, "transformers_", None) or getattr(est, "transformer_list", None)
+    if children:
+        return any(_learned_strings(step) for _, step, *_ in children)
+    for attr in ("categories_", "statistics_"):
+        learned = getattr(est, attr, None)
+        if learned is None:
+            continue
+        # categories_ is a list of per-column arrays, statistics_ one array
+        arrays = learned if isinstance(learned, list) else [learned]
+        if any(isinstance(v, str) for values in arrays for v in np.ravel(values)):
+            return True
+    return False
+
+
+def _is_numeric_only(est, columns: List[str]) -> bool:
+    """
+    Decide once at startup whether every feature is numeric, so requests can
+    be built as a float32 matrix. Models with string/categorical inputs (e.g.
+    the OneHotEncoder pipelines in housing_pipeline.py) keep a DataFrame path.
+    """
+    if not columns or _learned_strings(est):
+        return False
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            est.predict(pd.DataFrame(np.zeros((1, len(columns)), dtype=np.float32), columns=columns))
+    except Exception:
+        return False
+    return True
+
+
+def _accepts_ndarray(est, n_features: int) -> bool:
+    """
+    Probe whether the model can predict on a bare float array (no column names).
+    Pipelines that select columns by name need a DataFrame; purely numeric
+    pipelines only emit sklearn's "no valid feature names" warning, which
+    _sklearn_predict silences around its predict call.
+    """
+    if n_features == 0:
+        return False
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            est.predict(np.zeros((1, n_features), dtype=np.float32))
+    except Exception:
+        return False
+    return True
+
+
+def _build_features(instances: List[Dict[str, Any]]) -> np.ndarray:
+    """Build a float32 matrix in FEATURE_COLUMNS order straight from the dicts."""
+    rows = [GET_FEATURES(inst) for inst in instances]
+    # reshape covers the single-column case, where itemgetter returns a scalar
+    return np.asarray(rows, dtype=np.float32).reshape(len(rows), N_FEATURES)
+
+
+# -----------------------------------------------------------------------------
+# Prediction backends
+# -----------------------------------------------------------------------------
+def _sklearn_predict(X):
+    if isinstance(X, np.ndarray) and not ACCEPTS_NDARRAY:
+        # numeric-only model that needs names: wrap the already-ordered float32
+        # batch instead of rebuilding from the dicts (from_records is ~4x
+        # slower, so it is only used for non-numeric models); copy=False keeps
+        # it zero-copy under pandas copy-on-write defaults too
+        X = pd.DataFrame(X, columns=REQUIRED_COLUMNS, copy=False)
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        return model.predict(X)
+
+
+def _affine_steps(est):
+    """
+    Flatten (nested) pipeline steps into (W, b) pairs with step(X) == X @ W + b.
+    Returns None as soon as a step is not a recognized linear transform.
+    """
+    if est is None or est == "passthrough":
+        return []
+    if isinstance(est, Pipeline):
+        out = []
+        for _, step in est.steps:
+            sub = _affine_steps(step)
+            if sub is None:
+                return None
+            out.extend(sub)
+        return out
+    if isinstance(est, StandardScaler):
+        n = est.n_features_in_
+        # mean_ is still fitted when with_mean=False, but transform ignores it
+        mean = est.mean_ if est.with_mean else np.zeros(n)
+        scale = est.scale_ if est.with_std else np.ones(n)
+        return [(np.diag(1.0 / scale), -mean / scale)]
+    if type(est) is PCA:
+        W = est.components_.T.copy()
+        if est.whiten:
+            # same floor as PCA.transform for zero-variance components
+            W /= np.maximum(np.sqrt(est.explained_variance_), np.finfo(est.explained_variance_.dtype).eps)
+        return [(W, -est.mean_ @ W)]
+    return None
+
+
+def _build_fused_predict(est) -> Optional[Callable]:
+    """
+    For a Pipeline of StandardScaler/PCA steps followed by an estimator, fold
+    all preprocessing into a single affine map once, so each batch costs one
+    matmul before the final estimator instead of a pass per step.
+    """
+    if not isinstance(est, Pipeline):
+        return None
+    steps = _affine_steps(est[:-1])
+    if steps is None:
+        return None
+
+    n = est.n_features_in_
+    W, b = np.eye(n), np.zeros(n)
+    for W_step, b_step in steps:
+        W, b = W @ W_step, b @ W_step + b_step
+    W, b = W.astype(np.float32), b.astype(np.float32)
+    final = est.steps[-1][1]
+
+    def fused_predict(X: np.ndarray) -> np.ndarray:
+        # the final estimator was fitted on named columns; the folded matrix has none
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", message="X does not have valid feature names")
+            return final.predict(X @ W + b)
+
+    return fused_predict
+
+
+def _short_error(e: Exception, limit: int = 200) -> str:
+    """
+    Exception type plus the first line of its message, truncated: skl2onnx
+    errors can embed a whole serialized graph in the message.
+    """
+    lines = str(e).splitlines()
+    first = lines[0] if lines else ""
+    if len(first) > limit:
+        first = first[:limit] + "..."
+    return f"{type(e).__name__}: {first}"
+
+
+def _register_onnx_converters():
+    """skl2onnx only knows sklearn estimators; LightGBM/XGBoost come from onnxmltools."""
+    from onnxmltools.convert.lightgbm.operator_converters.LightGbm import convert_lightgbm
+    from skl2onnx import update_registered_converter
+    from skl2onnx.common.shape_calculator import calculate_linear_classifier_output_shapes
+
+    options = {"nocl": [True, False], "zipmap": [True, False, "columns"]}
+    try:
+        from lightgbm import LGBMClassifier
+
+        update_registered_converter(
+            LGBMClassifier, "LightGbmLGBMClassifier",
+            calculate_linear_classifier_output_shapes, convert_lightgbm, options=options,
+        )
+    except ImportError:
+        pass
+    try:
+        from onnxmltools.convert.xgboost.operator_converters.XGBoost import convert_xgboost
+        from xgboost import XGBClassifier
+
+        update_registered_converter(
+            XGBClassifier, "XGBoostXGBClassifier",
+            calculate_linear_classifier_output_shapes, convert_xgboost, options=options,
+        )
+    except ImportError:
+        pass
+
+
+def _build_onnx_predict(est, n_features: int) -> Callable:
+    import onnx
+    import onnxruntime as ort
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+
+    _register_onnx_converters()
+    # onnxmltools' tree converters only emit ai.onnx.ml up to opset 3
+    onx = convert_sklearn(
+        est,
+        initial_types=[("input", FloatTensorType([None, n_features]))],
+        target_opset={"": 17, "ai.onnx.ml": 3},
+    )
+    if USE_ONNX_INT8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        with tempfile.TemporaryDirectory() as tmp:
+            fp32_path, int8_path = Path(tmp) / "model.onnx", Path(tmp) / "model.int8.onnx"
+            fp32_path.write_bytes(onx.SerializeToString())
+            quantize_dynamic(
+                fp32_path, int8_path, weight_type=QuantType.QInt8,
+                # shape inference can't type tensors from the ai.onnx.ml tree ops
+                extra_options={"DefaultTensorType": onnx.TensorProto.FLOAT},
+            )
+            sess = ort.InferenceSession(str(int8_path), providers=["CPUExecutionProvider"])
+        print("✅ ONNX model quantized to INT8")
+    else:
+        sess = ort.InferenceSession(onx.SerializeToString(), providers=["CPUExecutionProvider"])
+    label = sess.get_outputs()[0].name  # only fetch labels, skip the probabilities
+
+    def onnx_predict(X: np.ndarray) -> np.ndarray:
+        return sess.run([label], {"input": X.astype(np.float32, copy=False)})[0]
+
+    return onnx_predict
+
+
+# -----------------------------------------------------------------------------
+# Micro-batcher
+# -----------------------------------------------------------------------------
+async def _batch_worker():
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _batch_queue.get()]
+        deadline = loop.time() + MAX_WAIT_MS / 1000
+
+        # drain whatever else arrives inside the window
+        while len(batch) < MAX_BATCH:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_batch_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        try:
+            X_batch = batch[0][0] if len(batch) == 1 else np.concatenate([X for X, _ in batch])
+            preds = await loop.run_in_executor(None, PREDICT_FN, X_batch)
+        except Exception as e:
+            if len(batch) == 1:
+                _, fut = batch[0]
+                if not fut.done():
+                    fut.set_exception(e)
+                continue
+            # re-run each request on its own so only the bad one gets the error
+            for X, fut in batch:
+                try:
+                    result = await loop.run_in_executor(None, PREDICT_FN, X)
+                except Exception as item_error:
+                    if not fut.done():
+                        fut.set_exception(item_error)
+                else:
+                    if not fut.done():
+                        fut.set_result(result)
+            continue
+
+        # scatter results back to each waiting request
+        start = 0
+        for X, fut in batch:
+            end = start + len(X)
+            if not fut.done():
+                fut.set_result(preds[start:end])
+            start = end
+
+
+async def _predict_batched(X):
+    if not isinstance(X, np.ndarray):
+        # DataFrames (non-numeric or unnamed-column models) are predicted per
+        # request: concatenating frames built from each request's own keys
+        # would realign columns across requests
+        return await asyncio.get_running_loop().run_in_executor(None, PREDICT_FN, X)
+    fut = asyncio.get_running_loop().create_future()
+    await _batch_queue.put((X, fut))
+    return await fut
 
 
 # -----------------------------------------------------------------------------
 # Routes
 # -----------------------------------------------------------------------------
 @app.get("/")
-def root():
+async def root():
     return {
         "service": "Breast Cancer Prediction API",
         "model_path": str(MODEL_PATH),
         "model_loaded": model is not None,
         "required_columns": REQUIRED_COLUMNS,
-        "endpoints": ["/health", "/predict", "/docs"],
+        "endpoints": ["/health", "/predict", "/predict_msgpack", "/predict_stream", "/docs"],
     }
 
 
 @app.get("/health")
-def health():
+async def health():
     if model is None:
         return {
             "status": "not_ready",
@@ -93,32 +571,130 @@ def health():
     return {"status": "healthy", "model_loaded": True, "model_path": str(MODEL_PATH)}
 
 
-@app.post("/predict", response_model=PredictResponse)
-def predict(request: PredictRequest):
+@app.post("/predict", response_model=PredictResponse, openapi_extra=_PREDICT_OPENAPI)
+async def predict(request: Request):
     if model is None:
         raise HTTPException(status_code=503, detail="Model not loaded. Check /health and startup logs.")
 
-    if not request.instances:
-        raise HTTPException(status_code=400, detail="No instances provided")
+    try:
+        instances = PREDICT_ADAPTER.validate_json(await request.body())["instances"]
+    except ValidationError as e:
+        raise _request_validation_error(e)
+
+    return await _predict_instances(instances)
+
+
+@app.post("/predict_msgpack", response_model=PredictResponse, openapi_extra=_PREDICT_MSGPACK_OPENAPI)
+async def predict_msgpack(request: Request):
+    """Same as /predict, but the body is msgpack-encoded ({"instances": [...]})."""
+    if model is None:
+        raise HTTPException(status_code=503, detail="Model not loaded. Check /health and startup logs.")
 
     try:
-        X = pd.DataFrame(request.instances)
+        payload = msgpack.unpackb(await request.body(), raw=False)
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid input format: {e}")
+        raise HTTPException(status_code=400, detail=f"Invalid msgpack payload: {e!r}")
+
+    try:
+        instances = PREDICT_ADAPTER.validate_python(payload)["instances"]
+    except ValidationError as e:
+        raise _request_validation_error(e)
+
+    return await _predict_instances(instances)
+
+
+@app.post("/predict_stream", openapi_extra=_PREDICT_OPENAPI)
+async def predict_stream(request: Request):
+    """
+    Same body as /predict; responds with NDJSON, one {"predictions": [...]}
+    line per STREAM_CHUNK instances, so large batches start arriving early.
+    """
+    if model is None:
+        raise HTTPException(status_code=503, detail="Model not loaded. Check /health and startup logs.")
+
+    try:
+        instances = PREDICT_ADAPTER.validate_json(await request.body())["instances"]
+    except ValidationError as e:
+        raise _request_validation_error(e)
+
+    X = _instances_to_features(instances)
+
+    async def gen():
+        for start in range(0, len(X), STREAM_CHUNK):
+            rows = slice(start, start + STREAM_CHUNK)
+            chunk = X[rows] if isinstance(X, np.ndarray) else X.iloc[rows]
+            try:
+                preds = await _predict_batched(chunk)
+            except Exception as e:
+                # status is already sent: report the failure in-band and stop
+                yield orjson.dumps({"error": f"Prediction failed: {e}"}) + b"\n"
+                return
+            yield orjson.dumps({"predictions": preds.astype(np.int64, copy=False).tolist()}) + b"\n"
+
+    # not compressed: _GZipMiddleware skips this route so lines flush per chunk
+    return StreamingResponse(gen(), media_type="application/x-ndjson")
+
+
+def _request_validation_error(e: ValidationError) -> RequestValidationError:
+    errors = e.errors(include_url=False)
+    for err in errors:
+        err["loc"] = ("body", *err["loc"])  # same loc shape as FastAPI's own body errors
+        # like FastAPI's JSON decode errors: don't echo the raw body back, and
+        # keep bytes (possibly not UTF-8) out of the JSON encoder
+        if err["type"] == "json_invalid":
+            err["input"] = {}
+        elif isinstance(err.get("input"), bytes):
+            err["input"] = repr(err["input"])
+    return RequestValidationError(errors)
+
+
+def _instances_to_features(instances: List[Dict[str, Any]]):
+    if not instances:
+        raise HTTPException(status_code=400, detail="No instances provided")
+
+    if not FEATURE_COLUMNS:
+        # model does not expose feature names: pass the frame through as-is
+        try:
+            return pd.DataFrame(instances)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid input format: {e}")
 
     # enforce required columns
-    if REQUIRED_COLUMNS:
-        missing = set(REQUIRED_COLUMNS) - set(X.columns)
-        if missing:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Missing required columns: {sorted(missing)}",
-            )
-        X = X[REQUIRED_COLUMNS]  # keep correct order
+    missing = REQUIRED_SET.difference(instances[0].keys())
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Missing required columns: {sorted(missing)}",
+        )
+
+    if not NUMERIC_ONLY:
+        # string/categorical features: the pipeline's encoders need the raw
+        # values; from_records picks REQUIRED_COLUMNS straight from the dicts
+        try:
+            return pd.DataFrame.from_records(instances, columns=REQUIRED_COLUMNS)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid input format: {e}")
+
+    try:
+        X = _build_features(instances)  # already in correct order
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Missing required columns: {[e.args[0]]}")
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid input format: {e}")
+    # the fused path skips StandardScaler/PCA's input checks, so reject
+    # NaN/inf here, including finite values that overflow float32; other
+    # backends keep the model's own handling (e.g. native missing values)
+    if CHECK_FINITE and not np.isfinite(X).all():
+        raise HTTPException(status_code=400, detail="Input contains NaN or infinity")
+    return X
+
+
+async def _predict_instances(instances: List[Dict[str, Any]]) -> PredictResponse:
+    X = _instances_to_features(instances)
 
     try:
-        preds = model.predict(X)
+        preds = await _predict_batched(X)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction failed: {e}")
 
-    return PredictResponse(predictions=[int(p) for p in preds], count=len(preds))
+    return PredictResponse(predictions=preds.astype(np.int64, copy=False).tolist(), count=len(preds))
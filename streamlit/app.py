@@ -4,6 +4,12 @@ from typing import Any, Dict
 
 import requests
 import streamlit as st
+from requests.adapters import HTTPAdapter
+
+try:
+    import msgpack
+except ImportError:  # fall back to JSON
+    msgpack = None
 
 # -----------------------------------------------------------------------------
 # MUST be the first Streamlit command
@@ -15,6 +21,7 @@ st.set_page_config(page_title="Breast Cancer Classification", page_icon="🧬",
 # -----------------------------------------------------------------------------
 API_BASE_URL = os.getenv("API_URL", "http://localhost:8000")
 PREDICT_ENDPOINT = f"{API_BASE_URL}/predict"
+PREDICT_MSGPACK_ENDPOINT = f"{API_BASE_URL}/predict_msgpack"
 HEALTH_ENDPOINT = f"{API_BASE_URL}/health"
 
 # Breast Cancer Wisconsin (sklearn) features (30)
@@ -30,15 +37,36 @@ FEATURES = [
 # -----------------------------------------------------------------------------
 # Helpers
 # -----------------------------------------------------------------------------
+@st.cache_resource
+def get_session() -> requests.Session:
+    """One pooled keep-alive session shared across reruns."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+SESSION = get_session()
+
 def call_api(payload: Dict[str, Any]) -> Dict[str, Any]:
-    resp = requests.post(PREDICT_ENDPOINT, json=payload, timeout=30)
+    resp = None
+    if msgpack is not None:
+        resp = SESSION.post(
+            PREDICT_MSGPACK_ENDPOINT,
+            data=msgpack.packb(payload),
+            headers={"Content-Type": "application/msgpack"},
+            timeout=30,
+        )
+    if resp is None or resp.status_code == 404:  # older API without /predict_msgpack
+        resp = SESSION.post(PREDICT_ENDPOINT, json=payload, timeout=30)
     if resp.status_code != 200:
         raise RuntimeError(f"API error {resp.status_code}: {resp.text}")
     return resp.json()
 
+@st.cache_data(ttl=5, show_spinner=False)
 def safe_get_health() -> str:
     try:
-        r = requests.get(HEALTH_ENDPOINT, timeout=10)
+        r = SESSION.get(HEALTH_ENDPOINT, timeout=10)
         if r.status_code == 200:
             return "healthy"
     except Exception:
@@ -92,25 +120,30 @@ DEFAULTS = {
     "mean fractal dimension": 0.06,
 }
 
-# layout: 2 columns of inputs
-col1, col2 = st.columns(2)
-
-for i, feat in enumerate(FEATURES):
-    default_val = float(DEFAULTS.get(feat, 0.0))
-    target_col = col1 if i % 2 == 0 else col2
-    with target_col:
-        user_input[feat] = st.number_input(
-            feat,
-            value=default_val,
-            step=0.01,
-            format="%.5f",
-            help="Enter a numeric value for this feature.",
-            key=feat,
-        )
-
-st.markdown("---")
-
-if st.button("🔮 Predict", type="primary"):
+# inputs live in a form so editing a value doesn't rerun the script;
+# only the submit button does
+with st.form("inputs"):
+    # layout: 2 columns of inputs
+    col1, col2 = st.columns(2)
+
+    for i, feat in enumerate(FEATURES):
+        default_val = float(DEFAULTS.get(feat, 0.0))
+        target_col = col1 if i % 2 == 0 else col2
+        with target_col:
+            user_input[feat] = st.number_input(
+                feat,
+                value=default_val,
+                step=0.01,
+                format="%.5f",
+                help="Enter a numeric value for this feature.",
+                key=feat,
+            )
+
+    st.markdown("---")
+
+    submitted = st.form_submit_button("🔮 Predict", type="primary")
+
+if submitted:
     payload = {"instances": [user_input]}
 
     with st.spinner("Calling API for prediction..."):
@@ -0,0 +1,327 @@
+"""
+Tests for the prediction API in api/app.py: the fused preprocessing fast
+path, request parsing, the micro-batcher and the HTTP endpoints.
+Run from the repo root: python -m pytest -q test_api.py
+"""
+
+import asyncio
+import operator
+import warnings
+
+import joblib
+import msgpack
+import numpy as np
+import orjson
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sklearn.compose import ColumnTransformer, make_column_selector
+from sklearn.datasets import make_classification
+from sklearn.decomposition import PCA
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline, make_pipeline
+from sklearn.preprocessing import MinMaxScaler, OneHotEncoder, StandardScaler
+
+from api import app as api_app
+from api.app import _build_fused_predict, _instances_to_features, _is_numeric_only
+
+
+@pytest.fixture(scope="module")
+def data():
+    X, y = make_classification(n_samples=300, n_features=8, n_informative=5, class_sep=2.0, random_state=0)
+    # offset and stretch the features so a wrong mean/scale changes predictions
+    X = X * np.arange(1, 9) + np.arange(8) * 10
+    return X.astype(np.float32), y
+
+
+@pytest.mark.parametrize(
+    "pipeline",
+    [
+        make_pipeline(StandardScaler(), LogisticRegression()),
+        make_pipeline(StandardScaler(with_mean=False), LogisticRegression()),
+        make_pipeline(StandardScaler(with_std=False), LogisticRegression()),
+        make_pipeline(StandardScaler(with_mean=False, with_std=False), LogisticRegression()),
+        make_pipeline(StandardScaler(), PCA(n_components=5, whiten=True), LogisticRegression()),
+        make_pipeline(
+            Pipeline([("scaler", StandardScaler(with_mean=False)), ("pca", PCA(n_components=6))]),
+            "passthrough",
+            LogisticRegression(),
+        ),
+    ],
+    ids=["scaler", "no_mean", "no_std", "no_mean_no_std", "whitened_pca", "nested"],
+)
+def test_fused_predict_matches_pipeline(pipeline, data):
+    X, y = data
+    pipeline.fit(X, y)
+
+    fused = _build_fused_predict(pipeline)
+
+    assert fused is not None
+    np.testing.assert_array_equal(fused(X), pipeline.predict(X))
+
+
+def test_fused_predict_silences_feature_name_warning(data):
+    X, y = data
+    frame = pd.DataFrame(X, columns=[f"f{i}" for i in range(X.shape[1])])
+    pipeline = make_pipeline(StandardScaler(), PCA(n_components=4), LogisticRegression()).fit(frame, y)
+    # make the final step look fitted on names, like the shipped LGBM model
+    pipeline[-1].feature_names_in_ = np.array(["pca0", "pca1", "pca2", "pca3"], dtype=object)
+
+    fused = _build_fused_predict(pipeline)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        fused(X)
+
+
+def test_fused_predict_whitening_floors_zero_variance(data):
+    X, y = data
+    # a constant column gives a PCA component with zero explained variance
+    X = np.hstack([X, np.ones((len(X), 1), dtype=np.float32)])
+    pipeline = make_pipeline(PCA(n_components=9, whiten=True), LogisticRegression(max_iter=1000)).fit(X, y)
+
+    fused = _build_fused_predict(pipeline)
+
+    np.testing.assert_array_equal(fused(X), pipeline.predict(X))
+
+
+def test_fused_predict_skips_unknown_steps(data):
+    X, y = data
+    pipeline = make_pipeline(MinMaxScaler(), LogisticRegression()).fit(X, y)
+
+    assert _build_fused_predict(pipeline) is None
+
+
+@pytest.fixture
+def two_columns(monkeypatch):
+    columns = ("a", "b")
+    monkeypatch.setattr(api_app, "FEATURE_COLUMNS", columns)
+    monkeypatch.setattr(api_app, "REQUIRED_SET", frozenset(columns))
+    monkeypatch.setattr(api_app, "N_FEATURES", len(columns))
+    monkeypatch.setattr(api_app, "GET_FEATURES", operator.itemgetter(*columns))
+    monkeypatch.setattr(api_app, "NUMERIC_ONLY", True)
+
+
+def test_non_finite_input_rejected_only_for_fused_predictor(two_columns, monkeypatch):
+    instances = [{"a": 1.0, "b": float("nan")}]
+
+    monkeypatch.setattr(api_app, "CHECK_FINITE", False)
+    X = _instances_to_features(instances)
+    assert np.isnan(X[0, 1])
+
+    monkeypatch.setattr(api_app, "CHECK_FINITE", True)
+    with pytest.raises(HTTPException) as exc:
+        _instances_to_features(instances)
+    assert exc.value.status_code == 400
+
+
+@pytest.fixture(scope="module")
+def mixed_frame():
+    X = pd.DataFrame({"num": [1.0, 2.0, 3.0, 4.0], "cat": ["a", "b", "a", "b"]})
+    return X, [0, 1, 0, 1]
+
+
+@pytest.mark.parametrize(
+    "encoder",
+    [
+        OneHotEncoder(),
+        # predicts fine on all-float input, so only the learned categories give it away
+        make_pipeline(SimpleImputer(strategy="most_frequent"), OneHotEncoder(handle_unknown="ignore")),
+    ],
+    ids=["onehot", "imputed_onehot_ignore"],
+)
+def test_categorical_pipelines_are_not_numeric_only(encoder, mixed_frame):
+    X, y = mixed_frame
+    selector = make_column_selector(dtype_include=object)
+    pipeline = make_pipeline(
+        ColumnTransformer([("cat", encoder, selector)], remainder="passthrough"), LogisticRegression()
+    ).fit(X, y)
+
+    assert not _is_numeric_only(pipeline, list(X.columns))
+
+
+def test_numeric_pipeline_is_numeric_only(data):
+    X, y = data
+    columns = [f"f{i}" for i in range(X.shape[1])]
+    pipeline = make_pipeline(StandardScaler(), LogisticRegression()).fit(pd.DataFrame(X, columns=columns), y)
+
+    assert _is_numeric_only(pipeline, columns)
+
+
+def test_non_numeric_model_gets_a_dataframe_in_column_order(monkeypatch):
+    columns = ["num", "cat"]
+    monkeypatch.setattr(api_app, "REQUIRED_COLUMNS", columns)
+    monkeypatch.setattr(api_app, "FEATURE_COLUMNS", tuple(columns))
+    monkeypatch.setattr(api_app, "REQUIRED_SET", frozenset(columns))
+    monkeypatch.setattr(api_app, "NUMERIC_ONLY", False)
+
+    X = _instances_to_features([{"cat": "a", "num": 2.5, "extra": 1}])
+
+    assert list(X.columns) == columns
+    assert X.iloc[0].tolist() == [2.5, "a"]
+
+
+# module state that startup_event() rebinds; restored after each served test
+_STARTUP_GLOBALS = (
+    "MODEL_PATH", "model", "REQUIRED_COLUMNS", "FEATURE_COLUMNS", "REQUIRED_SET", "N_FEATURES",
+    "GET_FEATURES", "NUMERIC_ONLY", "ACCEPTS_NDARRAY", "PREDICT_FN", "CHECK_FINITE",
+    "PREDICT_ADAPTER", "_batch_queue", "_batch_task",
+)
+
+
+@pytest.fixture
+def serve(monkeypatch, tmp_path):
+    """Return a factory: serve(fitted_model) -> TestClient that runs startup on `with`."""
+
+    def start(fitted, root_path=""):
+        for name in _STARTUP_GLOBALS:
+            monkeypatch.setattr(api_app, name, getattr(api_app, name))
+        for spec, media_type in ((api_app._PREDICT_OPENAPI, "application/json"),
+                                 (api_app._PREDICT_MSGPACK_OPENAPI, "application/msgpack")):
+            content = spec["requestBody"]["content"][media_type]
+            monkeypatch.setitem(content, "schema", content["schema"])
+        path = tmp_path / "model.joblib"
+        joblib.dump(fitted, path)
+        monkeypatch.setattr(api_app, "MODEL_PATH", path)
+        return TestClient(api_app.app, root_path=root_path)
+
+    return start
+
+
+def test_predict_accepts_string_features(serve, mixed_frame):
+    X, y = mixed_frame
+    pipeline = make_pipeline(
+        ColumnTransformer([("cat", OneHotEncoder(), ["cat"])], remainder="passthrough"), LogisticRegression()
+    ).fit(X, y)
+
+    instances = [{"num": 2.5, "cat": "a"}, {"num": 1.0, "cat": "b"}]
+
+    with serve(pipeline) as client:
+        resp = client.post("/predict", json={"instances": instances})
+
+    assert resp.status_code == 200
+    assert resp.json()["predictions"] == pipeline.predict(pd.DataFrame(instances)).tolist()
+
+
+@pytest.mark.parametrize("body", [b"{not json", b"\xff\xfe"], ids=["invalid_json", "invalid_utf8"])
+def test_invalid_json_body_is_not_echoed(body, monkeypatch):
+    monkeypatch.setattr(api_app, "model", object())  # skip the 503 without loading the model
+
+    resp = TestClient(api_app.app).post("/predict", content=body)
+
+    assert resp.status_code == 422
+    assert resp.json()["detail"][0]["input"] == {}
+
+
+def test_dataframe_inputs_bypass_the_batcher(monkeypatch):
+    seen = []
+    monkeypatch.setattr(api_app, "PREDICT_FN", lambda X: seen.append(list(X.columns)) or np.zeros(len(X)))
+    monkeypatch.setattr(api_app, "_batch_queue", None)  # would fail if the frame were queued
+
+    async def run():
+        frames = [pd.DataFrame([{"a": 1.0, "b": 2.0}]), pd.DataFrame([{"b": 2.0, "a": 1.0}])]
+        return await asyncio.gather(*(api_app._predict_batched(X) for X in frames))
+
+    asyncio.run(run())
+
+    assert seen == [["a", "b"], ["b", "a"]]
+
+
+def _run_batched(monkeypatch, predict, Xs):
+    """gather() one _predict_batched call per array against a live queue and worker."""
+    monkeypatch.setattr(api_app, "PREDICT_FN", predict)
+
+    async def run():
+        monkeypatch.setattr(api_app, "_batch_queue", asyncio.Queue())
+        worker = asyncio.create_task(api_app._batch_worker())
+        try:
+            return await asyncio.gather(*(api_app._predict_batched(X) for X in Xs), return_exceptions=True)
+        finally:
+            worker.cancel()
+
+    return asyncio.run(run())
+
+
+def _row_ids(sizes):
+    """One float32 block per request; column 0 numbers the rows across all requests."""
+    starts = np.cumsum([0, *sizes])
+    return [np.arange(a, b, dtype=np.float32).reshape(-1, 1).repeat(2, axis=1) for a, b in zip(starts, starts[1:])]
+
+
+def test_concurrent_requests_are_coalesced_and_scattered(monkeypatch):
+    batch_sizes = []
+
+    def predict(X):
+        batch_sizes.append(len(X))
+        return X[:, 0] * 10
+
+    Xs = _row_ids([1, 3, 2])
+
+    results = _run_batched(monkeypatch, predict, Xs)
+
+    assert batch_sizes == [6]
+    for X, preds in zip(Xs, results):
+        np.testing.assert_array_equal(preds, X[:, 0] * 10)
+
+
+def test_bad_request_in_batch_only_fails_itself(monkeypatch):
+    batch_sizes = []
+
+    def predict(X):
+        batch_sizes.append(len(X))
+        if np.isnan(X).any():
+            raise ValueError("bad row")
+        return X[:, 0] * 10
+
+    Xs = _row_ids([2, 1, 3])
+    Xs[1][0, 1] = np.nan
+
+    results = _run_batched(monkeypatch, predict, Xs)
+
+    # one failed batch, then each request re-run on its own
+    assert batch_sizes == [6, 2, 1, 3]
+    assert isinstance(results[1], ValueError)
+    for i in (0, 2):
+        np.testing.assert_array_equal(results[i], Xs[i][:, 0] * 10)
+
+
+@pytest.fixture
+def numeric_model(data):
+    X, y = data
+    frame = pd.DataFrame(X, columns=[f"f{i}" for i in range(X.shape[1])])
+    pipeline = make_pipeline(StandardScaler(), LogisticRegression()).fit(frame, y)
+    return pipeline, frame.iloc[:50].to_dict(orient="records"), pipeline.predict(frame.iloc[:50]).tolist()
+
+
+# behind a proxy prefix, scope["path"] includes the root path
+@pytest.mark.parametrize("root_path", ["", "/api"])
+def test_predict_stream_is_not_gzipped(serve, numeric_model, monkeypatch, root_path):
+    pipeline, instances, expected = numeric_model
+    monkeypatch.setattr(api_app, "STREAM_CHUNK", 20)
+
+    with serve(pipeline, root_path=root_path) as client:
+        resp = client.post(
+            f"{root_path}/predict_stream", json={"instances": instances}, headers={"Accept-Encoding": "gzip"}
+        )
+
+    assert resp.status_code == 200
+    assert "content-encoding" not in resp.headers
+    lines = [orjson.loads(line) for line in resp.content.splitlines()]
+    assert [len(line["predictions"]) for line in lines] == [20, 20, 10]
+    assert sum((line["predictions"] for line in lines), []) == expected
+
+
+def test_predict_msgpack_round_trip(serve, numeric_model):
+    pipeline, instances, expected = numeric_model
+
+    with serve(pipeline) as client:
+        resp = client.post(
+            "/predict_msgpack",
+            content=msgpack.packb({"instances": instances}),
+            headers={"Content-Type": "application/msgpack"},
+        )
+
+    assert resp.status_code == 200
+    assert resp.json() == {"predictions": expected, "count": len(expected)}